@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_sharding.py
+Benchmark do modo particionado (sharding.py) em um catálogo sintético.
+
+Mede consultas por segundo da pontuação por conteúdo e colaborativa com um
+único processo e com N processos, para mostrar o ganho ao usar mais núcleos.
+
+Uso:
+    python bench_sharding.py --items 500000 --top-m 20 --shards 1 2 4 8
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+
+from sharding import ShardedCatalog
+
+
+def single_process_content(features, norms, idx, k):
+    scores = features @ features[idx] / np.maximum(norms * norms[idx], 1e-12)
+    scores[idx] = -np.inf
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+def single_process_collaborative(sim, liked, k):
+    scores = np.asarray(sim[liked].sum(axis=0)).ravel()
+    scores[liked] = -np.inf
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+def queries_per_second(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do catálogo particionado")
+    parser.add_argument("--items", type=int, default=500_000, help="músicas no catálogo sintético (conteúdo)")
+    parser.add_argument("--top-m", type=int, default=20, help="vizinhos por música na similaridade esparsa")
+    parser.add_argument("--features", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--liked", type=int, default=30, help="músicas curtidas por consulta colaborativa")
+    parser.add_argument("--shards", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    features = rng.random((args.items, args.features), dtype=np.float32)
+    norms = np.linalg.norm(features, axis=1)
+    # Similaridade podada: top-M vizinhos aleatórios por música, como em song_cooccurrences.json
+    rows = np.repeat(np.arange(args.items), args.top_m)
+    cols = rng.integers(0, args.items, size=len(rows))
+    sim = sparse.csr_matrix((rng.random(len(rows), dtype=np.float32), (rows, cols)),
+                            shape=(args.items, args.items))
+
+    content_queries = rng.integers(0, args.items, size=args.queries)
+    collab_queries = [rng.choice(args.items, size=args.liked, replace=False) for _ in range(args.queries)]
+
+    print(f"Catálogo: {args.items} músicas, top-{args.top_m} vizinhos, "
+          f"{args.queries} consultas, K={args.k}, {os.cpu_count()} núcleos")
+    header = f"{'modo':<12}{'conteúdo q/s':>15}{'x':>7}{'colab q/s':>15}{'x':>7}"
+    print(header)
+    print("-" * len(header))
+
+    base = queries_per_second(lambda q: single_process_content(features, norms, q, args.k), content_queries)
+    base_collab = queries_per_second(lambda q: single_process_collaborative(sim, q, args.k), collab_queries)
+    print(f"{'1 processo':<12}{base:>15.1f}{1.0:>7.2f}{base_collab:>15.1f}{1.0:>7.2f}")
+
+    for n in args.shards:
+        pool = ShardedCatalog(features, n, cooccurrence=sim)
+        try:
+            # Sem filtros: só os índices excluídos vão para as fatias, como na API
+            def content_query(q):
+                pool.content_top_k(q, args.k, exclude=[q])
+
+            def collab_query(liked):
+                pool.collaborative_top_k(liked, args.k, exclude=liked)
+
+            qps = queries_per_second(content_query, content_queries)
+            qps_collab = queries_per_second(collab_query, collab_queries)
+            print(f"{str(n) + ' shards':<12}{qps:>15.1f}{qps / base:>7.2f}{qps_collab:>15.1f}{qps_collab / base_collab:>7.2f}")
+        finally:
+            pool.close()
+
+
+if __name__ == "__main__":
+    main()
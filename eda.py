@@ -1,67 +1,218 @@
 """
 eda.py
-ExploratÃ³rio dos dados de mÃºsicas (top50MusicFrom2010-2019.csv).
-Gera estatÃ­sticas e visualizaÃ§Ãµes para entender padrÃµes do dataset.
+Exploratório dos dados de músicas (top50MusicFrom2010-2019.csv).
+Gera estatísticas e visualizações para entender padrões do dataset.
+
+As estatísticas são calculadas numa única passada em blocos (média e variância
+online, histogramas de faixas fixas, correlação incremental e agregados por
+ano), então o uso de memória não cresce com o tamanho do catálogo. Opcionalmente
+mantém uma amostra reservatório para gráficos de dispersão.
+
+Uso:
+    python eda.py [arquivo.csv] --chunksize 100000 --sample 5000 [--store catalog_store]
 """
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from ingestion import CATALOG_CSV, DEFAULT_CHUNKSIZE, FEATURES, iter_catalog
 
-def load_and_clean(path):
-    df = pd.read_csv(path, encoding='utf-8', sep=',')
-    # Renomear colunas verbosas para nomes simples
-    col_map = {
-        'the genre of the track': 'genre',
-        'Beats.Per.Minute -The tempo of the song': 'Beats.Per.Minute',
-        'Energy- The energy of a song - the higher the value, the more energtic': 'Energy',
-        'Danceability - The higher the value, the easier it is to dance to this song': 'Danceability',
-        'Loudness/dB - The higher the value, the louder the song': 'Loudness/dB',
-        'Liveness - The higher the value, the more likely the song is a live recording': 'Liveness',
-        'Valence - The higher the value, the more positive mood for the song': 'Valence',
-        'Length - The duration of the song': 'Length',
-        'Acousticness - The higher the value the more acoustic the song is': 'Acousticness',
-        'Speechiness - The higher the value the more spoken word the song contains': 'Speechiness',
-        'Popularity- The higher the value the more popular the song is': 'Popularity'
-    }
-    df.rename(columns=col_map, inplace=True)
-    return df
+# Faixas fixas dos histogramas quando nenhum catálogo gravado é indicado (--store);
+# valores fora da faixa caem nas faixas extremas
+FEATURE_RANGES = {'BPM': (0, 250), 'Loudness': (-60, 0), 'Length': (0, 600)}
+DEFAULT_RANGE = (0, 100)
 
 
-def main():
-    df = load_and_clean('top50MusicFrom2010-2019.csv')
-    # VisÃ£o geral
-    print("Shape:", df.shape)
-    print("Colunas:", df.columns.tolist())
-    print("\nHead:\n", df.head())
-    print("\nEstatÃ­sticas descritivas:\n", df.describe())
-    print("\nContagem por gÃªnero:\n", df['genre'].value_counts())
-
-    # DistribuiÃ§Ãµes das features numÃ©ricas
-    numeric = ['Beats.Per.Minute','Energy','Danceability','Loudness/dB',
-               'Liveness','Valence','Length','Acousticness','Speechiness','Popularity']
-    df[numeric].hist(bins=20, figsize=(12,10))
-    plt.tight_layout()
-    plt.savefig('histograms.png')
+@contextmanager
+def stage(name, timings):
+    start = time.perf_counter()
+    yield
+    timings.append((name, time.perf_counter() - start))
 
-    # Heatmap de correlaÃ§Ã£o
-    plt.figure(figsize=(10,8))
-    sns.heatmap(df[numeric].corr(), annot=True, cmap='coolwarm')
-    plt.title('Feature Correlation')
-    plt.tight_layout()
-    plt.savefig('correlation.png')
-
-    # Popularidade mÃ©dia por ano
-    pop_by_year = df.groupby('year')['Popularity'].mean()
-    plt.figure()
-    pop_by_year.plot(marker='o')
-    plt.title('Avg Popularity by Year')
-    plt.xlabel('Year')
-    plt.ylabel('Avg Popularity')
+
+def histogram_ranges(store_dir=None):
+    # Usa os mínimos/máximos gravados por ingestion.py apenas quando o catálogo é
+    # indicado explicitamente, para não aplicar faixas de outro CSV
+    if store_dir is None:
+        return {feat: FEATURE_RANGES.get(feat, DEFAULT_RANGE) for feat in FEATURES}
+    with open(os.path.join(store_dir, 'stats.json'), 'r', encoding='utf-8') as f:
+        stats = json.load(f)
+    return {feat: (lo, hi if hi > lo else lo + 1)
+            for feat, lo, hi in zip(stats['features'], stats['min'], stats['max'])}
+
+
+class StreamingStats:
+    """
+    Estatísticas acumuladas bloco a bloco.
+
+    Média, variância e covariância são combinadas entre blocos pela fórmula
+    paralela de Chan et al., numericamente estável mesmo em catálogos grandes.
+    """
+
+    def __init__(self, columns, ranges, bins=20, sample_size=0, seed=42):
+        self.columns = columns
+        self.n = 0
+        self.mean = np.zeros(len(columns))
+        self.comoment = np.zeros((len(columns), len(columns)))
+        self.min = np.full(len(columns), np.inf)
+        self.max = np.full(len(columns), -np.inf)
+        self.edges = [np.linspace(*ranges[c], bins + 1) for c in columns]
+        self.hist = np.zeros((len(columns), bins), dtype=np.int64)
+        self.genre_counts = Counter()
+        self.year_count = Counter()
+        self.year_popularity = Counter()
+        self.sample_size = sample_size
+        self.sample = []
+        self.rng = np.random.default_rng(seed)
+        self.head = None
+
+    def update(self, chunk):
+        if self.head is None:
+            self.head = chunk.head()
+        X = chunk[self.columns].to_numpy(dtype=np.float64)
+        n_b = len(X)
+        if n_b == 0:
+            return
+        mean_b = X.mean(axis=0)
+        centered = X - mean_b
+        comoment_b = centered.T @ centered
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.comoment += comoment_b + np.outer(delta, delta) * self.n * n_b / n
+        self.mean += delta * n_b / n
+        self.n = n
+        self.min = np.minimum(self.min, X.min(axis=0))
+        self.max = np.maximum(self.max, X.max(axis=0))
+
+        for j, edges in enumerate(self.edges):
+            clipped = np.clip(X[:, j], edges[0], edges[-1])
+            self.hist[j] += np.histogram(clipped, bins=edges)[0]
+
+        self.genre_counts.update(chunk['genre'].value_counts().to_dict())
+        by_year = chunk.groupby('year')['Popularity'].agg(['count', 'sum'])
+        self.year_count.update(by_year['count'].to_dict())
+        self.year_popularity.update(by_year['sum'].to_dict())
+
+        if self.sample_size:
+            self._reservoir(chunk, n - n_b)
+
+    def _reservoir(self, chunk, seen):
+        # Algoritmo R: a linha t entra com probabilidade k / (t + 1)
+        k = self.sample_size
+        positions = seen + np.arange(len(chunk))
+        slots = np.where(positions < k, positions, self.rng.integers(0, positions + 1))
+        for i in np.flatnonzero(slots < k):
+            row = chunk.iloc[i]
+            if slots[i] < len(self.sample):
+                self.sample[slots[i]] = row
+            else:
+                self.sample.append(row)
+
+    def describe(self):
+        std = np.sqrt(self.comoment.diagonal() / max(self.n - 1, 1))
+        return pd.DataFrame({'count': self.n, 'mean': self.mean, 'std': std,
+                             'min': self.min, 'max': self.max}, index=self.columns).T
+
+    def correlation(self):
+        std = np.sqrt(self.comoment.diagonal())
+        denom = np.outer(std, std)
+        corr = np.divide(self.comoment, denom, out=np.zeros_like(self.comoment), where=denom > 0)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+    def popularity_by_year(self):
+        years = sorted(self.year_count)
+        return pd.Series([self.year_popularity[y] / self.year_count[y] for y in years], index=years)
+
+
+def plot_histograms(stats, path='histograms.png'):
+    ncols = 3
+    nrows = int(np.ceil(len(stats.columns) / ncols))
+    fig, axes = plt.subplots(nrows, ncols, figsize=(12, 10))
+    for ax, col, edges, counts in zip(axes.ravel(), stats.columns, stats.edges, stats.hist):
+        ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge')
+        ax.set_title(col)
+    for ax in axes.ravel()[len(stats.columns):]:
+        ax.axis('off')
     plt.tight_layout()
-    plt.savefig('popularity_by_year.png')
+    plt.savefig(path)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Análise exploratória em uma passada")
+    parser.add_argument("csv", nargs="?", default=CATALOG_CSV)
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--bins", type=int, default=20)
+    parser.add_argument("--sample", type=int, default=0,
+                        help="tamanho da amostra reservatório para gráficos de dispersão (0 = sem amostra)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--store", default=None,
+                        help="catálogo gravado por ingestion.py a partir deste CSV (faixas dos histogramas)")
+    args = parser.parse_args()
+
+    timings = []
+    stats = StreamingStats(FEATURES, histogram_ranges(args.store), bins=args.bins,
+                           sample_size=args.sample, seed=args.seed)
+    with stage('passada única', timings):
+        for chunk in iter_catalog(args.csv, args.chunksize):
+            stats.update(chunk)
+
+    # Visão geral
+    print("Shape:", (stats.n, len(stats.head.columns)))
+    print("Colunas:", stats.head.columns.tolist())
+    print("\nHead:\n", stats.head)
+    with stage('estatísticas descritivas', timings):
+        print("\nEstatísticas descritivas:\n", stats.describe())
+    print("\nContagem por gênero:\n", pd.Series(stats.genre_counts).sort_values(ascending=False))
+
+    # Distribuições das features numéricas
+    with stage('histogramas', timings):
+        plot_histograms(stats)
+
+    # Heatmap de correlação
+    with stage('correlação', timings):
+        plt.figure(figsize=(10,8))
+        sns.heatmap(stats.correlation(), annot=True, cmap='coolwarm')
+        plt.title('Feature Correlation')
+        plt.tight_layout()
+        plt.savefig('correlation.png')
+        plt.close()
+
+    # Popularidade média por ano
+    with stage('popularidade por ano', timings):
+        pop_by_year = stats.popularity_by_year()
+        plt.figure()
+        pop_by_year.plot(marker='o')
+        plt.title('Avg Popularity by Year')
+        plt.xlabel('Year')
+        plt.ylabel('Avg Popularity')
+        plt.tight_layout()
+        plt.savefig('popularity_by_year.png')
+        plt.close()
+
+    saved = ['histograms.png', 'correlation.png', 'popularity_by_year.png']
+    # Dispersão entre features sobre a amostra reservatório
+    if stats.sample:
+        with stage('dispersão (amostra)', timings):
+            sample = pd.DataFrame(stats.sample)
+            pd.plotting.scatter_matrix(sample[FEATURES].astype(float), figsize=(14, 14), s=5, alpha=0.5)
+            plt.tight_layout()
+            plt.savefig('sample_scatter.png')
+            plt.close('all')
+        saved.append('sample_scatter.png')
 
-    print("\nGrÃ¡ficos salvos: histograms.png, correlation.png, popularity_by_year.png")
+    print("\nGráficos salvos:", ", ".join(saved))
+    print("\nTempo por etapa:")
+    for name, seconds in timings:
+        print(f"  {name:<28}{seconds:>8.3f}s")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+evaluation.py
+Avaliação offline dos motores de recomendação (qualidade vs. latência).
+
+Faz divisões leave-k-out sobre `user_song_interactions.json`, executa os motores
+de conteúdo, colaborativo, híbrido e popularidade em lote (vetorizado, com
+paralelismo opcional por processos sobre fatias de usuários) e reporta
+precision@K, recall@K, NDCG@K, cobertura e vazão de cada motor numa única tabela.
+
+Uso:
+    python evaluation.py --k 10 --holdout 5 --workers 4
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+
+from matrix_factorization import ImplicitALS
+from modelo import df, features, title_index
+from user_interactions import SIMILARITY_MEASURE, SIMILARITY_MEASURES, TOP_M, item_similarity_matrix
+
+
+def load_interactions(path='user_song_interactions.json'):
+    with open(path, 'r', encoding='utf-8') as f:
+        interactions = json.load(f)
+    # Converter títulos para índices do catálogo, descartando os desconhecidos
+    return {
+        user: sorted({title_index[t] for t in songs if t in title_index})
+        for user, songs in interactions.items()
+    }
+
+
+def leave_k_out_split(interactions, holdout=5, seed=42):
+    """
+    Separa `holdout` músicas de cada usuário para teste.
+
+    Args:
+        interactions: Dicionário {user_id: [índices curtidos]}
+        holdout: Número de músicas retidas por usuário
+        seed: Semente do gerador aleatório
+
+    Returns:
+        Tupla (users, train, test) com matrizes booleanas usuário x música
+    """
+    rng = np.random.default_rng(seed)
+    users = [u for u, items in interactions.items() if len(items) > holdout]
+    n_items = len(df)
+    train = np.zeros((len(users), n_items), dtype=bool)
+    test = np.zeros((len(users), n_items), dtype=bool)
+    for row, user in enumerate(users):
+        items = np.asarray(interactions[user])
+        held = rng.choice(len(items), size=holdout, replace=False)
+        mask = np.zeros(len(items), dtype=bool)
+        mask[held] = True
+        test[row, items[mask]] = True
+        train[row, items[~mask]] = True
+    return users, train, test
+
+
+# Motores em lote: build(train, **opções) -> estado, score(estado, linhas) -> pontuações (B, N)
+
+def build_content(train, **options):
+    # A API calcula só a linha da música consultada; a avaliação em lote usa a matriz inteira
+    return cosine_similarity(df[features]).astype(np.float32)
+
+
+def score_content(sim, rows):
+    # Média da similaridade com as músicas curtidas
+    counts = np.maximum(rows.sum(axis=1, keepdims=True), 1)
+    return (rows.astype(np.float32) @ sim) / counts
+
+
+def build_collaborative(train, measure=SIMILARITY_MEASURE, top_m=TOP_M, **options):
+    # Mesma similaridade esparsa e podada (medida e top-M) usada para gerar song_cooccurrences.json
+    return item_similarity_matrix(sparse.csr_matrix(train), measure=measure, top_m=top_m)
+
+
+def score_collaborative(sim, rows):
+    return (sparse.csr_matrix(rows, dtype=np.float32) @ sim).toarray()
+
+
+def build_als(train, factors=16, **options):
+    return ImplicitALS(factors=factors).fit(sparse.csr_matrix(train))
+
+
+def score_als(model, rows):
+    # Fold-in das curtidas de treino e um produto escalar por música
+    return model.score(model.fold_in(rows))
+
+
+def _row_max_normalize(scores):
+    # Mesma normalização por máximo usada em hybrid_recommendations
+    peak = scores.max(axis=1, keepdims=True)
+    return np.divide(scores, peak, out=np.zeros_like(scores), where=peak > 0)
+
+
+def build_hybrid(train, content_weight=0.7, collab_weight=0.3, **options):
+    return (build_content(train), build_collaborative(train, **options), score_collaborative,
+            content_weight, collab_weight)
+
+
+def build_hybrid_als(train, content_weight=0.7, collab_weight=0.3, **options):
+    return build_content(train), build_als(train, **options), score_als, content_weight, collab_weight
+
+
+def score_hybrid(state, rows):
+    sim, collab_state, score_collab, content_weight, collab_weight = state
+    content = _row_max_normalize(score_content(sim, rows))
+    collab = _row_max_normalize(score_collab(collab_state, rows))
+    return content_weight * content + collab_weight * collab
+
+
+def build_popularity(train, **options):
+    return df["Popularity"].to_numpy(dtype=np.float32)
+
+
+def score_popularity(popularity, rows):
+    return np.broadcast_to(popularity, rows.shape).copy()
+
+
+ENGINES = {
+    "content": (build_content, score_content),
+    "collaborative": (build_collaborative, score_collaborative),
+    "hybrid": (build_hybrid, score_hybrid),
+    "als": (build_als, score_als),
+    "hybrid_als": (build_hybrid_als, score_hybrid),
+    "popularity": (build_popularity, score_popularity),
+}
+
+
+def top_k(scores, rows, k):
+    """Top-K por linha, excluindo as músicas já vistas no treino."""
+    k = min(k, scores.shape[1])
+    scores = np.where(rows, -np.inf, scores)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+# Estado do motor nos processos de trabalho (enviado uma vez pelo initializer)
+_worker_state = None
+
+
+def _init_worker(name, state):
+    global _worker_state
+    _worker_state = (name, state)
+
+
+def _warmup(_):
+    return _worker_state is not None
+
+
+def _batched_top_k(name, state, rows, k, batch_size):
+    # Pontua em lotes para não materializar a matriz (usuários x músicas) inteira
+    score = ENGINES[name][1]
+    return np.vstack([
+        top_k(score(state, rows[start:start + batch_size]), rows[start:start + batch_size], k)
+        for start in range(0, len(rows), batch_size)
+    ])
+
+
+def _score_shard(args):
+    rows, k, batch_size = args
+    name, state = _worker_state
+    return _batched_top_k(name, state, rows, k, batch_size)
+
+
+def start_pool(name, state, workers):
+    """Cria os processos e envia o estado do motor antes da parte cronometrada."""
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(name, state))
+    list(pool.map(_warmup, range(workers)))
+    return pool
+
+
+def recommend_batch(name, state, train, k, pool=None, workers=1, batch_size=256):
+    """Gera o top-K de todos os usuários, opcionalmente em paralelo por fatias."""
+    if pool is None or workers <= 1:
+        return _batched_top_k(name, state, train, k, batch_size)
+    shards = [s for s in np.array_split(train, workers) if len(s)]
+    return np.vstack(list(pool.map(_score_shard, [(s, k, batch_size) for s in shards])))
+
+
+def ranking_metrics(recs, test, k):
+    """
+    Calcula métricas de ranking vetorizadas.
+
+    Args:
+        recs: Matriz (usuários, K) com os índices recomendados
+        test: Matriz booleana usuário x música com os itens retidos
+        k: Tamanho da lista de recomendação
+
+    Returns:
+        Dicionário com precision, recall, ndcg e coverage
+    """
+    relevant = np.take_along_axis(test, recs, axis=1)
+    hits = relevant.sum(axis=1)
+    n_test = test.sum(axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (relevant * discounts).sum(axis=1)
+    idcg = np.cumsum(discounts)[np.minimum(n_test, k) - 1]
+    return {
+        "precision": float(np.mean(hits / k)),
+        "recall": float(np.mean(hits / n_test)),
+        "ndcg": float(np.mean(dcg / idcg)),
+        "coverage": len(np.unique(recs)) / test.shape[1],
+    }
+
+
+def evaluate(engines, k=10, holdout=5, seed=42, workers=1,
+             interactions_path='user_song_interactions.json', **options):
+    if holdout < 1:
+        raise ValueError("holdout deve ser >= 1")
+    interactions = load_interactions(interactions_path)
+    users, train, test = leave_k_out_split(interactions, holdout=holdout, seed=seed)
+    if not users:
+        raise ValueError(f"nenhum usuário tem mais de {holdout} músicas curtidas; reduza o holdout")
+    # K limitado às músicas não vistas no treino: nenhuma posição do top-K fica com -inf
+    k = min(k, int((~train).sum(axis=1).min()))
+    results = []
+    for name in engines:
+        build = ENGINES[name][0]
+        start = time.perf_counter()
+        state = build(train, **options)
+        build_s = time.perf_counter() - start
+
+        # Só a pontuação é cronometrada: criação dos processos e envio do estado ficam de fora
+        pool = start_pool(name, state, workers) if workers > 1 else None
+        try:
+            start = time.perf_counter()
+            recs = recommend_batch(name, state, train, k, pool=pool, workers=workers)
+            elapsed = time.perf_counter() - start
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        row = {"engine": name, "k": k, **ranking_metrics(recs, test, k)}
+        row["build_s"] = build_s
+        row["users_per_s"] = len(users) / elapsed if elapsed > 0 else float("inf")
+        results.append(row)
+    return results
+
+
+def print_table(results, k):
+    header = f"{'engine':<15}{'P@'+str(k):>9}{'R@'+str(k):>9}{'NDCG@'+str(k):>10}{'coverage':>10}{'build_s':>10}{'users/s':>12}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['engine']:<15}{r['precision']:>9.4f}{r['recall']:>9.4f}{r['ndcg']:>10.4f}"
+              f"{r['coverage']:>10.3f}{r['build_s']:>10.4f}{r['users_per_s']:>12.1f}")
+
+
+def positive_int(value):
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError("deve ser um inteiro >= 1")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avaliação offline dos motores de recomendação")
+    parser.add_argument("--k", type=positive_int, default=10, help="tamanho da lista recomendada")
+    parser.add_argument("--holdout", type=positive_int, default=5, help="músicas retidas por usuário")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="processos para pontuar fatias de usuários")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--interactions", default='user_song_interactions.json')
+    parser.add_argument("--measure", default=SIMILARITY_MEASURE, choices=SIMILARITY_MEASURES,
+                        help="similaridade item-item do motor colaborativo (padrão: a servida pela API)")
+    parser.add_argument("--top-m", type=int, default=TOP_M, help="vizinhos mantidos por música (poda)")
+    parser.add_argument("--factors", type=int, default=16, help="dimensão dos embeddings do ALS")
+    args = parser.parse_args()
+
+    try:
+        results = evaluate(args.engines, k=args.k, holdout=args.holdout, seed=args.seed,
+                           workers=args.workers, interactions_path=args.interactions,
+                           measure=args.measure, top_m=args.top_m, factors=args.factors)
+    except ValueError as e:
+        parser.error(str(e))
+    # K efetivo: limitado ao número de músicas não vistas de cada usuário
+    print_table(results, results[0]["k"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ingestion.py
+Ingestão do catálogo de músicas em blocos (streaming).
+
+Centraliza a leitura do CSV do catálogo usada por `modelo.py`,
+`user_interactions.py` e `eda.py`: renomeia e valida as colunas uma única vez,
+calcula mínimos/máximos de forma incremental e grava as características
+normalizadas e os metadados diretamente num diretório em disco, mantendo o pico
+de memória limitado ao tamanho de um bloco, qualquer que seja o catálogo.
+
+Uso:
+    python ingestion.py top50MusicFrom2010-2019.csv --store catalog_store
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CATALOG_CSV = 'top50MusicFrom2010-2019.csv'
+
+# Nomes verbosos do CSV -> nomes simples usados no projeto
+COLUMN_MAP = {
+    'the genre of the track': 'genre',
+    'Beats.Per.Minute -The tempo of the song': 'BPM',
+    'Energy- The energy of a song - the higher the value, the more energtic': 'Energy',
+    'Danceability - The higher the value, the easier it is to dance to this song': 'Danceability',
+    'Loudness/dB - The higher the value, the louder the song': 'Loudness',
+    'Liveness - The higher the value, the more likely the song is a live recording': 'Liveness',
+    'Valence - The higher the value, the more positive mood for the song': 'Valence',
+    'Length - The duration of the song': 'Length',
+    'Acousticness - The higher the value the more acoustic the song is': 'Acousticness',
+    'Speechiness - The higher the value the more spoken word the song contains': 'Speechiness',
+    'Popularity- The higher the value the more popular the song is': 'Popularity'
+}
+
+METADATA_COLUMNS = ['title', 'artist', 'genre', 'year']
+FEATURES = ['BPM', 'Energy', 'Danceability', 'Loudness', 'Liveness', 'Valence',
+            'Length', 'Acousticness', 'Speechiness', 'Popularity']
+
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def iter_catalog(path=CATALOG_CSV, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Lê o catálogo em blocos, com colunas renomeadas e validadas.
+
+    Args:
+        path: Caminho do CSV
+        chunksize: Linhas por bloco
+
+    Yields:
+        DataFrames com as colunas METADATA_COLUMNS + FEATURES
+    """
+    offset = 0
+    for chunk in pd.read_csv(path, encoding='utf-8', sep=',', chunksize=chunksize):
+        chunk = chunk.rename(columns=COLUMN_MAP)
+        missing = [c for c in METADATA_COLUMNS + FEATURES if c not in chunk.columns]
+        if missing:
+            raise ValueError(f"Colunas ausentes em {path}: {missing}")
+        for col in FEATURES + ['year']:
+            values = pd.to_numeric(chunk[col], errors='coerce')
+            if values.isna().any():
+                bad = offset + int(np.flatnonzero(values.isna().to_numpy())[0])
+                raise ValueError(f"Valor não numérico em '{col}' na linha {bad} de {path}")
+            chunk[col] = values
+        offset += len(chunk)
+        yield chunk[METADATA_COLUMNS + FEATURES]
+
+
+def load_catalog(path=CATALOG_CSV, chunksize=DEFAULT_CHUNKSIZE):
+    """Carrega o catálogo inteiro em memória (valores brutos), lido em blocos."""
+    return pd.concat(iter_catalog(path, chunksize), ignore_index=True)
+
+
+class RunningMinMax:
+    """Mínimos e máximos por característica acumulados bloco a bloco (estilo partial_fit)."""
+
+    def __init__(self, n_features=len(FEATURES)):
+        self.data_min = np.full(n_features, np.inf)
+        self.data_max = np.full(n_features, -np.inf)
+        self.n_samples = 0
+
+    def partial_fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if len(X):
+            self.data_min = np.minimum(self.data_min, X.min(axis=0))
+            self.data_max = np.maximum(self.data_max, X.max(axis=0))
+            self.n_samples += len(X)
+        return self
+
+    def transform(self, X):
+        # Mesma convenção do MinMaxScaler: colunas constantes viram 0
+        X = np.asarray(X, dtype=np.float64)
+        data_range = self.data_max - self.data_min
+        data_range[data_range == 0] = 1.0
+        return (X - self.data_min) / data_range
+
+    def to_dict(self):
+        return {"features": FEATURES, "min": self.data_min.tolist(),
+                "max": self.data_max.tolist(), "rows": self.n_samples}
+
+
+def compute_min_max(path=CATALOG_CSV, chunksize=DEFAULT_CHUNKSIZE):
+    """Primeira passada: mínimos/máximos das características sem carregar o CSV inteiro."""
+    scaler = RunningMinMax()
+    for chunk in iter_catalog(path, chunksize):
+        scaler.partial_fit(chunk[FEATURES].to_numpy())
+    return scaler
+
+
+def build_store(path=CATALOG_CSV, store_dir='catalog_store', chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Grava o catálogo normalizado em disco em duas passadas.
+
+    Arquivos gerados em `store_dir`:
+        features.npy  - matriz float32 (N, F) normalizada, escrita bloco a bloco
+        metadata.csv  - title, artist, genre, year
+        stats.json    - mínimos/máximos e número de linhas
+
+    Returns:
+        RunningMinMax com as estatísticas do catálogo
+    """
+    scaler = compute_min_max(path, chunksize)
+    os.makedirs(store_dir, exist_ok=True)
+    features = np.lib.format.open_memmap(os.path.join(store_dir, 'features.npy'), mode='w+',
+                                         dtype=np.float32, shape=(scaler.n_samples, len(FEATURES)))
+    metadata_path = os.path.join(store_dir, 'metadata.csv')
+    offset = 0
+    for i, chunk in enumerate(iter_catalog(path, chunksize)):
+        features[offset:offset + len(chunk)] = scaler.transform(chunk[FEATURES].to_numpy())
+        chunk[METADATA_COLUMNS].to_csv(metadata_path, mode='w' if i == 0 else 'a',
+                                       header=(i == 0), index=False, encoding='utf-8')
+        offset += len(chunk)
+    features.flush()
+    del features
+    with open(os.path.join(store_dir, 'stats.json'), 'w', encoding='utf-8') as f:
+        json.dump(scaler.to_dict(), f, indent=2)
+    return scaler
+
+
+def load_store(store_dir='catalog_store'):
+    """
+    Abre um catálogo gravado por build_store.
+
+    Returns:
+        Tupla (metadata, features) com o DataFrame de metadados e a matriz
+        normalizada mapeada em memória (somente leitura)
+    """
+    metadata = pd.read_csv(os.path.join(store_dir, 'metadata.csv'), encoding='utf-8')
+    features = np.load(os.path.join(store_dir, 'features.npy'), mmap_mode='r')
+    if len(metadata) != len(features):
+        raise ValueError(f"Catálogo inconsistente em {store_dir}: "
+                         f"{len(metadata)} metadados para {len(features)} linhas de características")
+    return metadata, features
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestão do catálogo em blocos")
+    parser.add_argument("csv", nargs="?", default=CATALOG_CSV)
+    parser.add_argument("--store", default='catalog_store', help="diretório de saída")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    scaler = build_store(args.csv, args.store, args.chunksize)
+    print(f"Catálogo gravado em {args.store}: {scaler.n_samples} músicas, {len(FEATURES)} características")
+
+
+if __name__ == "__main__":
+    main()
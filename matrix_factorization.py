@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+matrix_factorization.py
+Fatoração de matrizes para feedback implícito (ALS) sobre as interações usuário-música.
+
+Treina embeddings compactos (float32) de usuários e músicas. Para servir, a
+pontuação de um usuário é um único produto da matriz de músicas pelo vetor do
+usuário; usuários com curtidas novas são projetados por fold-in. As soluções de
+mínimos quadrados são feitas em blocos de usuários/músicas distribuídos entre
+threads (o NumPy libera o GIL durante a álgebra linear).
+
+Uso:
+    python matrix_factorization.py   # treina e salva als_model.npz
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+
+class ImplicitALS:
+    """
+    ALS implícito (Hu, Koren & Volinsky) com confiança c = 1 + alpha para cada curtida.
+
+    Args:
+        factors: Dimensão dos embeddings
+        regularization: Regularização L2
+        alpha: Peso de confiança das interações observadas
+        iterations: Número de alternâncias usuário/música
+        block_size: Linhas resolvidas por bloco
+        n_jobs: Threads para os blocos (None = número de núcleos)
+        seed: Semente da inicialização
+    """
+
+    def __init__(self, factors=16, regularization=1.0, alpha=5.0, iterations=15,
+                 block_size=256, n_jobs=None, seed=42):
+        self.factors = factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.iterations = iterations
+        self.block_size = block_size
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.seed = seed
+        self.user_factors = None
+        self.item_factors = None
+        self.fingerprint = None
+        self._item_gram = None
+
+    def fit(self, X):
+        """
+        Treina o modelo.
+
+        Args:
+            X: Matriz esparsa binária (usuários x músicas)
+        """
+        X = sparse.csr_matrix(X, dtype=np.float32)
+        Xt = X.T.tocsr()
+        rng = np.random.default_rng(self.seed)
+        self.user_factors = (rng.standard_normal((X.shape[0], self.factors)) * 0.01).astype(np.float32)
+        self.item_factors = (rng.standard_normal((X.shape[1], self.factors)) * 0.01).astype(np.float32)
+        for _ in range(self.iterations):
+            self.user_factors = self._solve(X, self.item_factors)
+            self.item_factors = self._solve(Xt, self.user_factors)
+        self._item_gram = self._gram(self.item_factors)
+        return self
+
+    def _gram(self, Y):
+        # YtY + λI: parte comum a todas as linhas, calculada uma vez por matriz fixa
+        Y64 = Y.astype(np.float64)
+        return Y64.T @ Y64 + self.regularization * np.eye(self.factors)
+
+    def _solve(self, R, Y, base=None):
+        """Resolve os fatores de todas as linhas de R mantendo Y fixo."""
+        Y64 = Y.astype(np.float64)
+        if base is None:
+            base = self._gram(Y)
+        out = np.zeros((R.shape[0], self.factors), dtype=np.float32)
+
+        def solve_block(lo):
+            hi = min(lo + self.block_size, R.shape[0])
+            A = np.repeat(base[None], hi - lo, axis=0)
+            b = np.zeros((hi - lo, self.factors))
+            for r in range(lo, hi):
+                Yu = Y64[R.indices[R.indptr[r]:R.indptr[r + 1]]]
+                if len(Yu):
+                    # A = YtY + Yt(Cu - I)Y + λI ; b = Yt Cu p(u)
+                    A[r - lo] += self.alpha * (Yu.T @ Yu)
+                    b[r - lo] = (1.0 + self.alpha) * Yu.sum(axis=0)
+            out[lo:hi] = np.linalg.solve(A, b[..., None])[..., 0]
+
+        starts = range(0, R.shape[0], self.block_size)
+        if self.n_jobs > 1:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+                list(pool.map(solve_block, starts))
+        else:
+            for lo in starts:
+                solve_block(lo)
+        return out
+
+    def fold_in(self, rows):
+        """
+        Projeta usuários novos (ou com curtidas novas) sem retreinar as músicas.
+
+        Args:
+            rows: Matriz (usuários x músicas) ou lista de índices curtidos por um usuário
+
+        Returns:
+            Embeddings float32 dos usuários (2D) ou do usuário (1D)
+        """
+        if self._item_gram is None:
+            self._item_gram = self._gram(self.item_factors)
+        if isinstance(rows, (list, tuple, np.ndarray)) and np.ndim(rows) == 1:
+            # Um único sistema f x f sobre o YtY em cache, sem blocos nem threads
+            Yu = self.item_factors[np.unique(np.asarray(rows, dtype=int))].astype(np.float64)
+            A = self._item_gram + self.alpha * (Yu.T @ Yu)
+            b = (1.0 + self.alpha) * Yu.sum(axis=0)
+            return np.linalg.solve(A, b).astype(np.float32)
+        return self._solve(sparse.csr_matrix(rows, dtype=np.float32), self.item_factors, base=self._item_gram)
+
+    def score(self, user_vectors):
+        """Pontuação de todas as músicas: um produto escalar por música."""
+        return user_vectors @ self.item_factors.T
+
+    def save(self, path, user_ids=None):
+        np.savez(path, user_factors=self.user_factors, item_factors=self.item_factors,
+                 user_ids=np.array(user_ids if user_ids is not None else [], dtype=str),
+                 fingerprint=np.array(self.fingerprint or ""))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        model = cls(factors=data["item_factors"].shape[1])
+        model.user_factors = data["user_factors"]
+        model.item_factors = data["item_factors"]
+        model.fingerprint = str(data["fingerprint"]) if "fingerprint" in data.files else None
+        model._item_gram = model._gram(model.item_factors)
+        return model, data["user_ids"].tolist()
+
+
+def data_fingerprint(titles, interactions):
+    """
+    Impressão digital dos dados de treino: títulos do catálogo (em ordem) e interações.
+
+    Gravada junto do modelo para detectar um als_model.npz treinado sobre outro
+    catálogo ou sobre curtidas que já mudaram.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(list(titles), ensure_ascii=False).encode('utf-8'))
+    digest.update(json.dumps(interactions, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def interaction_matrix(interactions, title_index, n_items):
+    """
+    Monta a matriz esparsa usuário x música a partir de {user_id: [títulos]}.
+
+    Returns:
+        Tupla (user_ids, X) com as linhas de X na ordem de user_ids
+    """
+    user_ids = list(interactions)
+    rows, cols = [], []
+    for u, user in enumerate(user_ids):
+        for idx in {title_index[t] for t in interactions[user] if t in title_index}:
+            rows.append(u)
+            cols.append(idx)
+    X = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                          shape=(len(user_ids), n_items))
+    return user_ids, X
+
+
+def main():
+    from user_interactions import load_music_data
+
+    print("Carregando dados...")
+    df = load_music_data()
+    title_index = {}
+    for i, t in enumerate(df["title"]):
+        title_index.setdefault(t, i)
+    with open('user_song_interactions.json', 'r', encoding='utf-8') as f:
+        interactions = json.load(f)
+
+    user_ids, X = interaction_matrix(interactions, title_index, len(df))
+    print(f"Treinando ALS implícito em {X.shape[0]} usuários x {X.shape[1]} músicas...")
+    model = ImplicitALS().fit(X)
+    model.fingerprint = data_fingerprint(df["title"], interactions)
+    model.save('als_model.npz', user_ids=user_ids)
+    print("Modelo salvo em als_model.npz")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,181 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import Optional, Dict, List
+from typing import Annotated, Literal, Optional, Dict, List
+from contextlib import asynccontextmanager
 import pandas as pd
 from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
 import numpy as np
+from scipy import sparse
+import json
+import os
 import random
+from ingestion import CATALOG_CSV, FEATURES, RunningMinMax, iter_catalog, load_store
+from matrix_factorization import ImplicitALS, data_fingerprint, interaction_matrix
+from sharding import ShardedCatalog
+from singleflight import SingleFlight, normalize_key
+from user_interactions import prune_neighbors
 
-app = FastAPI()
-
-# Carregar dados
-data = pd.read_csv('top50MusicFrom2010-2019.csv',encoding='utf-8', sep=',')
-df = pd.DataFrame(data)
-
-# Ajustar nomes de colunas para simplificar features
-df.rename(columns={
-     'the genre of the track': 'genre',
-     'Beats.Per.Minute -The tempo of the song': 'BPM',
-     'Energy- The energy of a song - the higher the value, the more energtic': 'Energy',
-     'Danceability - The higher the value, the easier it is to dance to this song': 'Danceability',
-     'Loudness/dB - The higher the value, the louder the song': 'Loudness',
-     'Liveness - The higher the value, the more likely the song is a live recording': 'Liveness',
-     'Valence - The higher the value, the more positive mood for the song': 'Valence',
-     'Length - The duration of the song': 'Length',
-     'Acousticness - The higher the value the more acoustic the song is': 'Acousticness',
-     'Speechiness - The higher the value the more spoken word the song contains': 'Speechiness',
-     'Popularity- The higher the value the more popular the song is': 'Popularity'
- }, inplace=True)
-
-# Pré-processamento
-features = ['BPM', 'Energy', 'Danceability', 
-'Loudness',
- 'Liveness', 'Valence', 'Length', 'Acousticness', 
-'Speechiness', 'Popularity']
-scaler = MinMaxScaler()
-df[features] = scaler.fit_transform(df[features])
-
-# Modelo de similaridade
-similarity_matrix = cosine_similarity(df[features])
+# Carregar dados: do catálogo gravado por ingestion.py, só quando CATALOG_STORE é
+# definido explicitamente (evita servir um diretório antigo esquecido no disco),
+# ou do CSV lido em blocos, com colunas validadas e mínimos/máximos incrementais
+CATALOG_STORE = os.environ.get("CATALOG_STORE")
+features = FEATURES
+if CATALOG_STORE:
+    metadata, feature_matrix = load_store(CATALOG_STORE)
+    # Características mantidas em float32, como gravadas em features.npy
+    df = pd.concat([metadata, pd.DataFrame(np.asarray(feature_matrix), columns=features)], axis=1)
+else:
+    chunks = []
+    scaler = RunningMinMax()
+    for chunk in iter_catalog(CATALOG_CSV):
+        scaler.partial_fit(chunk[features].to_numpy())
+        chunks.append(chunk)
+    df = pd.concat(chunks, ignore_index=True)
+    # Pré-processamento
+    df[features] = scaler.transform(df[features].to_numpy())
+
+# Índice título -> linha do catálogo (primeira ocorrência)
+title_index = {}
+for i, t in enumerate(df["title"]):
+    title_index.setdefault(t, i)
+
+# Máscaras booleanas pré-calculadas para filtros por gênero, artista e ano
+genre_masks = {g: (df["genre"] == g).to_numpy() for g in df["genre"].unique()}
+artist_masks = {a: (df["artist"] == a).to_numpy() for a in df["artist"].unique()}
+year_masks = {int(y): (df["year"] == y).to_numpy() for y in df["year"].unique()}
+empty_mask = np.zeros(len(df), dtype=bool)
+
+def build_filter_mask(genres=None, artists=None, year_min=None, year_max=None):
+    """
+    Combina as máscaras pré-calculadas: OU dentro de cada filtro, E entre filtros.
+
+    Returns:
+        Array booleano com as músicas permitidas, ou None se não houver filtros
+    """
+    parts = []
+    if genres:
+        parts.append(np.logical_or.reduce([genre_masks.get(g, empty_mask) for g in genres]))
+    if artists:
+        parts.append(np.logical_or.reduce([artist_masks.get(a, empty_mask) for a in artists]))
+    if year_min is not None or year_max is not None:
+        lo = year_min if year_min is not None else min(year_masks)
+        hi = year_max if year_max is not None else max(year_masks)
+        in_range = [m for y, m in year_masks.items() if lo <= y <= hi]
+        parts.append(np.logical_or.reduce(in_range) if in_range else empty_mask)
+    if not parts:
+        return None
+    return np.logical_and.reduce(parts)
+
+def allowed_mask(filter_mask=None, exclude=()):
+    """
+    Máscara das músicas candidatas: as que passam nos filtros, sem as excluídas.
+
+    Args:
+        filter_mask: Resultado de build_filter_mask (None = sem filtros)
+        exclude: Índices que não podem ser recomendados (música de referência, curtidas)
+    """
+    allowed = np.ones(len(df), dtype=bool) if filter_mask is None else filter_mask.copy()
+    allowed[list(exclude)] = False
+    return allowed
+
+# Dados de interação carregados uma vez. As similaridades são podadas aos
+# COLLAB_TOP_M vizinhos por música, então cada consulta colaborativa toca no
+# máximo M entradas por música curtida, mesmo com arquivos de contagens brutas.
+COLLAB_TOP_M = int(os.environ.get("COLLAB_TOP_M", "50"))
+
+def load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_song_cooccurrences():
+    cooccurrences = load_json('song_cooccurrences.json')
+    if cooccurrences is not None and COLLAB_TOP_M > 0:
+        cooccurrences = prune_neighbors(cooccurrences, COLLAB_TOP_M)
+    return cooccurrences
+
+user_interactions = load_json('user_song_interactions.json')
+song_cooccurrences = load_song_cooccurrences()
+# Guardado à parte: no modo particionado o dicionário é descartado após virar CSR nas fatias
+has_cooccurrences = song_cooccurrences is not None
+
+# Modo particionado opcional: RECO_SHARDS=N distribui a pontuação entre N processos locais
+N_SHARDS = int(os.environ.get("RECO_SHARDS", "0"))
+shard_pool = None
+
+def load_cooccurrence_matrix():
+    # Matriz esparsa N x N (já podada aos top-M vizinhos) indexada pelas linhas do catálogo
+    if song_cooccurrences is None:
+        return None
+    rows, cols, values = [], [], []
+    for song, related in song_cooccurrences.items():
+        if song in title_index:
+            for related_song, count in related.items():
+                if related_song in title_index:
+                    rows.append(title_index[song])
+                    cols.append(title_index[related_song])
+                    values.append(count)
+    # Entradas duplicadas (títulos repetidos) são somadas na conversão
+    return sparse.csr_matrix((np.asarray(values, dtype=np.float32), (rows, cols)), shape=(len(df), len(df)))
+
+# Motor ALS implícito: carregado de als_model.npz ou treinado na inicialização
+ALS_MODEL_PATH = 'als_model.npz'
+als_model = None
+als_user_rows = {}
+
+def load_als_model():
+    # Modelo ausente, ou treinado sobre outro catálogo ou outras curtidas: retreina e regrava o arquivo
+    fingerprint = data_fingerprint(df["title"], user_interactions)
+    model = None
+    if os.path.exists(ALS_MODEL_PATH):
+        model, user_ids = ImplicitALS.load(ALS_MODEL_PATH)
+    if model is None or model.fingerprint != fingerprint:
+        user_ids, X = interaction_matrix(user_interactions, title_index, len(df))
+        model = ImplicitALS().fit(X)
+        model.fingerprint = fingerprint
+        model.save(ALS_MODEL_PATH, user_ids=user_ids)
+    return model, {u: i for i, u in enumerate(user_ids)}
+
+def init_engines():
+    """
+    Cria os processos das fatias e o modelo ALS uma única vez.
+
+    Chamada na inicialização da API, antes de existirem as threads do executor:
+    o fork dos processos das fatias não herda locks de outras threads e as
+    requisições só leem os objetos prontos, sem inicialização concorrente.
+    """
+    global shard_pool, song_cooccurrences, als_model, als_user_rows
+    if N_SHARDS > 0 and shard_pool is None:
+        if song_cooccurrences is None and has_cooccurrences:
+            # Reinicialização após close_engines: o dicionário já foi descartado
+            song_cooccurrences = load_song_cooccurrences()
+        shard_pool = ShardedCatalog(df[features].to_numpy(), N_SHARDS, cooccurrence=load_cooccurrence_matrix())
+        # As fatias já têm suas colunas da similaridade; o coordenador não precisa do dicionário
+        song_cooccurrences = None
+    if als_model is None and user_interactions is not None:
+        als_model, als_user_rows = load_als_model()
+
+def close_engines():
+    global shard_pool
+    if shard_pool is not None:
+        shard_pool.close()
+        shard_pool = None
+
+@asynccontextmanager
+async def lifespan(app):
+    init_engines()
+    try:
+        yield
+    finally:
+        close_engines()
+
+app = FastAPI(lifespan=lifespan)
+
+# Requisições idênticas em andamento compartilham um único cálculo
+singleflight = SingleFlight()
 
 class GenreArtistRequest(BaseModel):
     genre: Optional[str] = None
@@ -52,26 +188,45 @@ class HybridRequest(BaseModel):
     content_weight: float = 0.7
     collab_weight: float = 0.3
     limit: int = 5
+    collab_engine: Literal["cooc", "als"] = "cooc"
+    genre: Optional[List[str]] = None
+    artist: Optional[List[str]] = None
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
 
 templates = Jinja2Templates(directory="templates")
 
 @app.get("/recommendations/content-based/{song_title}")
-async def content_based_recommendations(song_title: str, limit: int = 5, weights: Optional[Dict[str, float]] = None):
+async def content_based_recommendations(song_title: str, limit: int = 5, weights: Optional[Dict[str, float]] = None,
+                                        genre: Annotated[Optional[List[str]], Query()] = None,
+                                        artist: Annotated[Optional[List[str]], Query()] = None,
+                                        year_min: Optional[int] = None, year_max: Optional[int] = None):
+    key = normalize_key("content", song_title=song_title, limit=limit, weights=weights, genre=genre,
+                        artist=artist, year_min=year_min, year_max=year_max)
+    return await singleflight.do(key, compute_content_based, song_title, limit, weights, genre, artist, year_min, year_max)
+
+def compute_content_based(song_title, limit=5, weights=None, genre=None, artist=None, year_min=None, year_max=None):
     # Recomendação baseada em conteúdo
-    if weights:
-        X = df[features].copy()
-        for feat, w in weights.items():
-            if feat in X.columns:
-                X[feat] *= w
-        sim = cosine_similarity(X.values)
-    else:
-        sim = similarity_matrix
     if song_title not in df["title"].values:
         raise HTTPException(status_code=404, detail="Song not found")
-    idx = int(df[df["title"] == song_title].index[0])
-    sims = list(enumerate(sim[idx]))
-    sims.sort(key=lambda x: x[1], reverse=True)
-    sims = [(i, sc) for i, sc in sims if i != idx][:limit]
+    idx = title_index[song_title]
+    # Filtros aplicados dentro da pontuação: só candidatos permitidos entram no ranking
+    filter_mask = build_filter_mask(genre, artist, year_min, year_max)
+    w = np.array([weights.get(f, 1.0) for f in features]) if weights else None
+    pool = shard_pool
+    if pool is not None:
+        # Modo particionado: cada fatia devolve seu top-K e o coordenador junta;
+        # a máscara só é enviada quando há filtros
+        sims = pool.content_top_k(idx, limit, weights=w, mask=filter_mask, exclude=[idx])
+    else:
+        # Só a linha da música de referência: O(N·F) por consulta, sem matriz N x N
+        X = df[features].to_numpy()
+        if w is not None:
+            X = X * w
+        sim = cosine_similarity(X[[idx]], X)[0]
+        candidates = np.flatnonzero(allowed_mask(filter_mask, [idx]))
+        order = np.argsort(-sim[candidates], kind="stable")[:limit]
+        sims = [(int(candidates[o]), sim[candidates[o]]) for o in order]
     recs = []
     for i, sc in sims:
         row = df.iloc[i].to_dict()
@@ -93,31 +248,30 @@ async def genre_artist_recommendations(request: GenreArtistRequest):
     return {"recommendations": top[["title","artist","genre","Popularity"]].to_dict("records")} 
 
 @app.get("/recommendations/collaborative/{user_id}")
-async def collaborative_recommendations(user_id: str):
+async def collaborative_recommendations(user_id: str, engine: Literal["cooc", "als"] = "cooc",
+                                        genre: Annotated[Optional[List[str]], Query()] = None,
+                                        artist: Annotated[Optional[List[str]], Query()] = None,
+                                        year_min: Optional[int] = None, year_max: Optional[int] = None):
+    key = normalize_key("collaborative", user_id=user_id, engine=engine, genre=genre,
+                        artist=artist, year_min=year_min, year_max=year_max)
+    return await singleflight.do(key, compute_collaborative, user_id, engine, genre, artist, year_min, year_max)
+
+def compute_collaborative(user_id, engine="cooc", genre=None, artist=None, year_min=None, year_max=None):
     # Filtro colaborativo usando dados de interação pré-calculados
-    import json
-    import os
-    
+    filter_mask = build_filter_mask(genre, artist, year_min, year_max)
     # Verificar se os arquivos de interação existem
-    if not os.path.exists('user_song_interactions.json') or not os.path.exists('song_cooccurrences.json'):
+    if user_interactions is None or (engine == "cooc" and not has_cooccurrences):
         # Fallback para o método original se os arquivos não existirem
-        random.seed(user_id)
-        liked = random.sample(df["title"].tolist(), min(10, len(df)))
+        # Gerador local: as threads do single-flight não compartilham a semente global
+        rng = random.Random(user_id)
+        liked = rng.sample(df["title"].tolist(), min(10, len(df)))
         cooc = {}
         for song in liked:
             others = [t for t in df["title"] if t != song]
-            recs = random.sample(others, min(5, len(others)))
+            recs = rng.sample(others, min(5, len(others)))
             for r in recs:
                 cooc[r] = cooc.get(r, 0) + 1
     else:
-        # Carregar as interações dos usuários
-        with open('user_song_interactions.json', 'r', encoding='utf-8') as f:
-            user_interactions = json.load(f)
-        
-        # Carregar as co-ocorrências entre músicas
-        with open('song_cooccurrences.json', 'r', encoding='utf-8') as f:
-            song_cooccurrences = json.load(f)
-        
         # Se o usuário não estiver na base, criar um novo perfil
         if user_id not in user_interactions:
             # Escolher um usuário existente aleatoriamente como base
@@ -127,12 +281,38 @@ async def collaborative_recommendations(user_id: str):
             liked = user_interactions[user_id]
         
         # Calcular recomendações baseadas em co-ocorrências
-        cooc = {}
-        for song in liked:
-            if song in song_cooccurrences:
-                for related_song, count in song_cooccurrences[song].items():
-                    if related_song not in liked:  # Não recomendar músicas que o usuário já curtiu
-                        cooc[related_song] = cooc.get(related_song, 0) + count
+        pool = shard_pool
+        if engine == "als":
+            # Um produto escalar contra a matriz de músicas; usuários fora da base entram por fold-in
+            model = als_model
+            if model is None:
+                raise HTTPException(status_code=503, detail="ALS model not initialized")
+            liked_idx = [title_index[s] for s in liked if s in title_index]
+            if user_id in als_user_rows:
+                user_vector = model.user_factors[als_user_rows[user_id]]
+            else:
+                user_vector = model.fold_in(liked_idx)
+            scores = model.score(user_vector)
+            candidates = np.flatnonzero(allowed_mask(filter_mask, liked_idx))
+            top = candidates[np.argsort(-scores[candidates], kind="stable")[:5]]
+            cooc = {df["title"].iat[i]: float(scores[i]) for i in top}
+        elif pool is not None and pool.has_cooccurrence:
+            # Modo particionado: cada fatia devolve seu top-5 e o coordenador junta
+            liked_idx = [title_index[s] for s in liked if s in title_index]
+            top = pool.collaborative_top_k(liked_idx, 5, mask=filter_mask, exclude=liked_idx)
+            cooc = {df["title"].iat[i]: sc for i, sc in top}
+        else:
+            liked_set = set(liked)
+            cooc = {}
+            for song in liked:
+                if song in song_cooccurrences:
+                    for related_song, count in song_cooccurrences[song].items():
+                        if related_song not in liked_set:  # Não recomendar músicas que o usuário já curtiu
+                            cooc[related_song] = cooc.get(related_song, 0) + count
+    
+    # Manter apenas músicas do catálogo que passam nos filtros
+    cooc = {t: c for t, c in cooc.items()
+            if t in title_index and (filter_mask is None or filter_mask[title_index[t]])}
     
     # Ordenar e formatar as recomendações
     sorted_cooc = sorted(cooc.items(), key=lambda x: x[1], reverse=True)
@@ -140,10 +320,9 @@ async def collaborative_recommendations(user_id: str):
     
     # Obter as 5 músicas mais recomendadas
     for title, cnt in sorted_cooc[:5]:
-        if title in df["title"].values:  # Verificar se a música existe no DataFrame
-            row = df[df["title"] == title].iloc[0].to_dict()
-            row["score"] = float(cnt)
-            out.append(row)
+        row = df.iloc[title_index[title]].to_dict()
+        row["score"] = float(cnt)
+        out.append(row)
     
     # Informações sobre o usuário atual
     user_info = {
@@ -156,9 +335,16 @@ async def collaborative_recommendations(user_id: str):
 
 @app.post("/recommendations/hybrid")
 async def hybrid_recommendations(request: HybridRequest):
-    # Combinação de conteúdo e colaborativo
-    content = await content_based_recommendations(request.song_title, limit=request.limit)
-    collab = await collaborative_recommendations(request.user_id)
+    key = normalize_key("hybrid", **request.model_dump())
+    return await singleflight.do(key, compute_hybrid, request)
+
+def compute_hybrid(request: HybridRequest):
+    # Combinação de conteúdo e colaborativo. Chama os cálculos diretamente (já numa
+    # thread do executor), sem passar de novo pelo single-flight dos outros endpoints
+    filters = {"genre": request.genre, "artist": request.artist,
+               "year_min": request.year_min, "year_max": request.year_max}
+    content = compute_content_based(request.song_title, limit=request.limit, **filters)
+    collab = compute_collaborative(request.user_id, engine=request.collab_engine, **filters)
     
     # Obter pontuações das recomendações baseadas em conteúdo
     c_scores = {r["title"]: r["score"] for r in content["recommendations"]}
@@ -239,6 +425,11 @@ async def popular_recommendations(year: Optional[str] = None, genre: Optional[st
     # Retornar apenas as recomendações sem as informações adicionais de filtro
     return {"recommendations": top[["title","artist","genre","year","Popularity"]].to_dict("records")} 
 
+@app.get("/metrics/singleflight")
+async def singleflight_metrics():
+    # Requisições recebidas, cálculos executados e requisições coalescidas por endpoint
+    return singleflight.metrics()
+
 @app.get("/", response_class=HTMLResponse)
 async def ui_index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
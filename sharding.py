@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+sharding.py
+Pontuação do catálogo particionada entre processos locais (scatter-gather).
+
+O catálogo é dividido em N fatias contíguas. Cada processo de trabalho recebe
+sua fatia da matriz de características e das colunas da matriz esparsa de
+similaridade (podada aos top-M vizinhos, formato CSR) em memória compartilhada,
+calcula o top-K local de cada consulta e o coordenador junta os resultados com
+um heap. O coordenador não guarda cópia das características (o vetor da música
+de referência vem da fatia que a contém) e nenhuma matriz densa N x N é criada:
+a memória total fica em O(N·F + N·M).
+"""
+
+import heapq
+import multiprocessing as mp
+import threading
+from itertools import chain
+from multiprocessing import shared_memory
+
+import numpy as np
+from scipy import sparse
+
+
+def _to_shared(array, dtype=np.float32):
+    """Copia um array para um bloco novo de memória compartilhada."""
+    array = np.ascontiguousarray(array, dtype=dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _local_top_k(scores, offset, k, mask=None, exclude=None, positive_only=False):
+    """
+    Top-K de uma fatia, devolvido como lista de (score, índice global).
+
+    `scores` é modificado: músicas fora da máscara ou excluídas recebem -inf,
+    sem criar máscara nem lista de candidatos quando não há filtros.
+    """
+    if mask is not None:
+        scores[~mask] = -np.inf
+    if exclude is not None and len(exclude):
+        scores[exclude] = -np.inf
+    if k <= 0 or len(scores) == 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+    floor = 0 if positive_only else -np.inf
+    return [(float(scores[i]), int(i + offset)) for i in top if scores[i] > floor]
+
+
+def _shard_worker(conn, lo, hi, features_spec, cooc_spec):
+    """Laço de um processo de trabalho: responde consultas sobre a fatia [lo, hi)."""
+    blocks = []
+    shm, feats = _attach(*features_spec)
+    blocks.append(shm)
+    norms = np.linalg.norm(feats, axis=1)
+    indptr = indices = data = None
+    if cooc_spec is not None:
+        arrays = []
+        for spec in cooc_spec:
+            shm, array = _attach(*spec)
+            blocks.append(shm)
+            arrays.append(array)
+        indptr, indices, data = arrays
+
+    try:
+        while True:
+            msg = conn.recv()
+            op = msg[0]
+            if op == "close":
+                break
+            if op == "vector":
+                conn.send(np.array(feats[msg[1]]))
+            elif op == "content":
+                _, query, weights, k, mask, exclude = msg
+                if weights is None:
+                    scores = feats @ query
+                    denom = norms
+                else:
+                    weighted = feats * weights
+                    scores = weighted @ query
+                    denom = np.linalg.norm(weighted, axis=1)
+                # Similaridade do cosseno (a consulta já chega normalizada)
+                scores = np.divide(scores, denom, out=np.zeros_like(scores), where=denom > 0)
+                conn.send(_local_top_k(scores, lo, k, mask, exclude))
+            elif op == "collaborative":
+                _, liked, k, mask, exclude = msg
+                if indptr is None:
+                    conn.send([])
+                    continue
+                # Cada música curtida toca apenas os seus vizinhos que caem nesta fatia
+                scores = np.zeros(hi - lo, dtype=np.float32)
+                for row in liked:
+                    start, stop = indptr[row], indptr[row + 1]
+                    # Índices de uma linha CSR canônica são únicos
+                    scores[indices[start:stop]] += data[start:stop]
+                conn.send(_local_top_k(scores, lo, k, mask, exclude, positive_only=True))
+    finally:
+        for shm in blocks:
+            shm.close()
+        conn.close()
+
+
+class ShardedCatalog:
+    """
+    Catálogo particionado entre processos locais.
+
+    Args:
+        features: Matriz (N, F) de características normalizadas
+        n_shards: Número de processos de trabalho
+        cooccurrence: Matriz esparsa (N, N) de similaridade entre músicas (opcional)
+    """
+
+    def __init__(self, features, n_shards, cooccurrence=None):
+        self.n_items = len(features)
+        self.n_shards = max(1, min(int(n_shards), self.n_items))
+        self.bounds = np.linspace(0, self.n_items, self.n_shards + 1).astype(int)
+        self.has_cooccurrence = cooccurrence is not None
+        self._lock = threading.Lock()
+        self._blocks = []
+        self._conns = []
+        self._procs = []
+
+        # fork evita reimportar o módulo principal; spawn fica para plataformas sem fork
+        ctx = mp.get_context("fork" if "fork" in mp.get_all_start_methods() else "spawn")
+        if cooccurrence is not None:
+            cooccurrence = sparse.csc_matrix(cooccurrence, dtype=np.float32)
+        for lo, hi in zip(self.bounds[:-1], self.bounds[1:]):
+            # Só a fatia vai para a memória compartilhada; o coordenador não guarda a matriz
+            shm, features_spec = _to_shared(features[lo:hi])
+            self._blocks.append(shm)
+            cooc_spec = None
+            if cooccurrence is not None:
+                # Cada fatia guarda, em CSR, as colunas das músicas que ela pontua
+                local = cooccurrence[:, lo:hi].tocsr()
+                local.sum_duplicates()
+                cooc_spec = []
+                for array, dtype in ((local.indptr, np.int64), (local.indices, np.int32), (local.data, np.float32)):
+                    shm, spec = _to_shared(array, dtype)
+                    self._blocks.append(shm)
+                    cooc_spec.append(spec)
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_shard_worker, args=(child, int(lo), int(hi), features_spec, cooc_spec),
+                               daemon=True)
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+
+    def _scatter_gather(self, build_message, k, mask, exclude):
+        # Sem filtros nenhuma máscara trafega: só os poucos índices excluídos de cada fatia
+        exclude = np.unique(np.asarray([] if exclude is None else exclude, dtype=np.int64))
+        with self._lock:
+            for conn, lo, hi in zip(self._conns, self.bounds[:-1], self.bounds[1:]):
+                local = exclude[(exclude >= lo) & (exclude < hi)] - lo
+                conn.send(build_message(None if mask is None else mask[lo:hi], local))
+            partial = [conn.recv() for conn in self._conns]
+        # Empates resolvidos pelo menor índice, como na ordenação estável da API
+        return [(idx, score) for score, idx in
+                heapq.nlargest(k, chain.from_iterable(partial), key=lambda x: (x[0], -x[1]))]
+
+    def _vector(self, idx):
+        # Vetor de características pedido à fatia que contém a música
+        shard = int(np.searchsorted(self.bounds, idx, side="right")) - 1
+        with self._lock:
+            self._conns[shard].send(("vector", int(idx - self.bounds[shard])))
+            return self._conns[shard].recv()
+
+    def content_top_k(self, idx, k, weights=None, mask=None, exclude=None):
+        """
+        Top-K por similaridade do cosseno com a música `idx`.
+
+        Args:
+            idx: Índice da música de referência
+            k: Número de recomendações
+            weights: Vetor de pesos por característica (opcional)
+            mask: Array booleano com as músicas permitidas, só quando há filtros (opcional)
+            exclude: Índices que não podem ser recomendados, como a própria `idx` (opcional)
+
+        Returns:
+            Lista [(índice, score), ...] em ordem decrescente
+        """
+        query = self._vector(idx)
+        if weights is not None:
+            query = query * weights
+        norm = np.linalg.norm(query)
+        query = query / norm if norm > 0 else query
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float32)
+        return self._scatter_gather(lambda m, ex: ("content", query, weights, k, m, ex), k, mask, exclude)
+
+    def collaborative_top_k(self, liked, k, mask=None, exclude=None):
+        """Top-K pela soma das similaridades com as músicas curtidas."""
+        liked = np.asarray(liked, dtype=np.int64)
+        return self._scatter_gather(lambda m, ex: ("collaborative", liked, k, m, ex), k, mask, exclude)
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.send(("close",))
+                    conn.close()
+                except (BrokenPipeError, OSError):
+                    pass
+            for proc in self._procs:
+                proc.join(timeout=5)
+            for shm in self._blocks:
+                shm.close()
+                shm.unlink()
+            self._conns, self._procs, self._blocks = [], [], []
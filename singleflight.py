@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+singleflight.py
+Coalescência de requisições idênticas em andamento (single-flight).
+
+Quando várias requisições com os mesmos parâmetros (normalizados) chegam ao
+mesmo tempo, apenas a primeira executa o cálculo; as demais aguardam e recebem
+o mesmo resultado (ou a mesma exceção). Assim, a carga de CPU em picos cresce
+com o número de consultas distintas, e não com o total de requisições.
+"""
+
+import asyncio
+import functools
+from collections import Counter
+
+
+def _freeze(value):
+    # Forma canônica e hashable dos parâmetros: ordem de listas e dicionários não importa
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted((_freeze(v) for v in value), key=repr))
+    return value
+
+
+def normalize_key(name, **params):
+    """Chave de coalescência: nome da operação + parâmetros normalizados."""
+    return (name, _freeze(params))
+
+
+class SingleFlight:
+    """
+    Registro das computações em andamento, indexadas pela chave normalizada.
+
+    Funções síncronas rodam no executor padrão do loop (liberando o loop para
+    receber as requisições concorrentes); corrotinas rodam como tarefas.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.requests = Counter()
+        self.executions = Counter()
+        self.coalesced = Counter()
+
+    async def do(self, key, fn, *args, **kwargs):
+        name = key[0]
+        self.requests[name] += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced[name] += 1
+        else:
+            self.executions[name] += 1
+            if asyncio.iscoroutinefunction(fn):
+                future = asyncio.ensure_future(fn(*args, **kwargs))
+            else:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+            self._inflight[key] = future
+            # Remove a chave ao terminar, mesmo que o primeiro cliente desista
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: o cancelamento de um cliente não cancela o cálculo compartilhado
+        return await asyncio.shield(future)
+
+    def metrics(self):
+        names = sorted(set(self.requests) | set(self.executions))
+        return {
+            "requests": sum(self.requests.values()),
+            "executions": sum(self.executions.values()),
+            "coalesced": sum(self.coalesced.values()),
+            "in_flight": len(self._inflight),
+            "by_endpoint": {
+                n: {"requests": self.requests[n], "executions": self.executions[n],
+                    "coalesced": self.coalesced[n]}
+                for n in names
+            },
+        }
@@ -8,31 +8,16 @@ Este script cria um conjunto de dados simulados de usuários e suas interações
 com músicas, com base na popularidade e gênero das músicas.
 """
 
-import pandas as pd
 import numpy as np
 import json
 import os
 import random
-from collections import defaultdict
+from scipy import sparse
+from ingestion import CATALOG_CSV, load_catalog
 
-# Carregar dados das músicas
+# Carregar dados das músicas (colunas renomeadas e validadas por ingestion.py)
 def load_music_data():
-    data = pd.read_csv('top50MusicFrom2010-2019.csv', encoding='utf-8', sep=',')
-    # Renomear colunas para simplificar
-    data.rename(columns={
-        'the genre of the track': 'genre',
-        'Beats.Per.Minute -The tempo of the song': 'BPM',
-        'Energy- The energy of a song - the higher the value, the more energtic': 'Energy',
-        'Danceability - The higher the value, the easier it is to dance to this song': 'Danceability',
-        'Loudness/dB - The higher the value, the louder the song': 'Loudness',
-        'Liveness - The higher the value, the more likely the song is a live recording': 'Liveness',
-        'Valence - The higher the value, the more positive mood for the song': 'Valence',
-        'Length - The duration of the song': 'Length',
-        'Acousticness - The higher the value the more acoustic the song is': 'Acousticness',
-        'Speechiness - The higher the value the more spoken word the song contains': 'Speechiness',
-        'Popularity- The higher the value the more popular the song is': 'Popularity'
-    }, inplace=True)
-    return data
+    return load_catalog(CATALOG_CSV)
 
 # Definir perfis de usuários fictícios
 def create_user_profiles(n_users=100):
@@ -125,29 +110,132 @@ def generate_user_interactions(df, users, interaction_density=0.1):
     
     return all_interactions
 
+# Medidas de similaridade suportadas para as co-ocorrências
+SIMILARITY_MEASURES = ("count", "cosine", "jaccard", "lift", "pmi")
+
+def item_similarity_matrix(X, measure="count", top_m=None, block_size=1024):
+    """
+    Calcula a similaridade item-item esparsa a partir da matriz usuário x música.
+    
+    Args:
+        X: Matriz esparsa binária (usuários x músicas)
+        measure: "count" (co-ocorrência bruta), "cosine", "jaccard", "lift" ou
+            "pmi" (PMI positiva: pares com PMI <= 0 são descartados)
+        top_m: Número máximo de vizinhos mantidos por música (None = todos)
+        block_size: Músicas processadas por bloco; limita o pico de memória
+    
+    Returns:
+        Matriz esparsa CSR (músicas x músicas) com no máximo top_m entradas por linha
+    """
+    if measure not in SIMILARITY_MEASURES:
+        raise ValueError(f"Medida desconhecida: {measure}")
+    X = sparse.csc_matrix(X, dtype=np.float32)
+    n_users, n_items = X.shape
+    counts = np.asarray(X.sum(axis=0)).ravel()
+    Xt = X.T.tocsr()
+    
+    blocks = []
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+        # Co-ocorrências do bloco: (bloco x músicas), sem a diagonal
+        C = (Xt[start:stop] @ X).tocoo()
+        rows, cols, co = C.row, C.col, C.data.astype(np.float64)
+        keep = (rows + start) != cols
+        rows, cols, co = rows[keep], cols[keep], co[keep]
+        n_i, n_j = counts[rows + start], counts[cols]
+        
+        if measure == "count":
+            values = co
+        elif measure == "cosine":
+            values = co / np.sqrt(n_i * n_j)
+        elif measure == "jaccard":
+            values = co / (n_i + n_j - co)
+        elif measure == "lift":
+            values = co * n_users / (n_i * n_j)
+        else:
+            values = np.log(co * n_users / (n_i * n_j))
+        
+        positive = values > 0
+        block = sparse.csr_matrix((values[positive], (rows[positive], cols[positive])),
+                                  shape=(stop - start, n_items), dtype=np.float32)
+        if top_m is not None:
+            block = _prune_rows(block, top_m)
+        blocks.append(block)
+    
+    if not blocks:
+        return sparse.csr_matrix((n_items, n_items), dtype=np.float32)
+    return sparse.vstack(blocks, format="csr")
+
+def _prune_rows(S, top_m):
+    # Mantém apenas as top_m maiores entradas de cada linha
+    S = S.tocsr()
+    indptr, indices, data = [0], [], []
+    for i in range(S.shape[0]):
+        lo, hi = S.indptr[i], S.indptr[i + 1]
+        row_data, row_idx = S.data[lo:hi], S.indices[lo:hi]
+        if hi - lo > top_m:
+            best = np.argpartition(-row_data, top_m - 1)[:top_m]
+            row_data, row_idx = row_data[best], row_idx[best]
+        indices.append(row_idx)
+        data.append(row_data)
+        indptr.append(indptr[-1] + len(row_idx))
+    if not indices:
+        return S
+    return sparse.csr_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=S.shape)
+
+def prune_neighbors(similarities, top_m):
+    """
+    Poda um dicionário {música: {relacionada: score}} para os top_m vizinhos de cada música.
+    """
+    if top_m is None:
+        return similarities
+    return {
+        song: dict(sorted(related.items(), key=lambda x: x[1], reverse=True)[:top_m])
+        for song, related in similarities.items()
+    }
+
 # Gerar co-ocorrências entre músicas
-def generate_song_cooccurrences(interactions):
+def generate_song_cooccurrences(interactions, measure="count", top_m=None):
     """
-    Gera uma matriz de co-ocorrências entre músicas baseada nas interações dos usuários.
+    Gera a similaridade entre músicas baseada nas interações dos usuários.
     
     Args:
         interactions: Dicionário {user_id: [lista de músicas curtidas]}
+        measure: Medida de similaridade (ver item_similarity_matrix)
+        top_m: Número máximo de vizinhos mantidos por música (None = todos)
     
     Returns:
-        Dicionário {song: {related_song: count, ...}}
+        Dicionário {song: {related_song: score, ...}}
     """
-    cooccurrence = defaultdict(lambda: defaultdict(int))
+    songs = sorted({song for liked in interactions.values() for song in liked})
+    song_index = {song: i for i, song in enumerate(songs)}
+    
+    # Matriz esparsa usuário x música, binária: um título curtido mais de uma vez
+    # pelo mesmo usuário conta uma só vez (o laço aninhado antigo contava cada repetição)
+    rows, cols = [], []
+    for u, liked in enumerate(interactions.values()):
+        for song in set(liked):
+            rows.append(u)
+            cols.append(song_index[song])
+    X = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                          shape=(len(interactions), len(songs)))
     
-    # Para cada usuário e suas músicas curtidas
-    for user, songs in interactions.items():
-        # Para cada par de músicas curtidas pelo mesmo usuário
-        for song1 in songs:
-            for song2 in songs:
-                if song1 != song2:
-                    cooccurrence[song1][song2] += 1
+    S = item_similarity_matrix(X, measure=measure, top_m=top_m)
+    cooccurrence = {}
+    for i, song in enumerate(songs):
+        lo, hi = S.indptr[i], S.indptr[i + 1]
+        if hi > lo:
+            cooccurrence[song] = {
+                songs[j]: (int(v) if measure == "count" else float(v))
+                for j, v in zip(S.indices[lo:hi], S.data[lo:hi])
+            }
     
     return cooccurrence
 
+# Medida de similaridade e vizinhos mantidos por música em song_cooccurrences.json
+SIMILARITY_MEASURE = "cosine"
+TOP_M = 50
+
 # Função principal
 def main():
     # Carregar dados
@@ -163,14 +251,9 @@ def main():
     print("Gerando interações usuário-música...")
     interactions = generate_user_interactions(df, users, interaction_density=0.1)
     
-    # Gerar co-ocorrências
-    print("Calculando co-ocorrências entre músicas...")
-    cooccurrences = generate_song_cooccurrences(interactions)
-    
-    # Converter para formato adequado para salvar
-    cooc_dict = {}
-    for song, related in cooccurrences.items():
-        cooc_dict[song] = dict(related)
+    # Gerar similaridades normalizadas e podadas aos top-M vizinhos
+    print(f"Calculando similaridades entre músicas ({SIMILARITY_MEASURE}, top-{TOP_M})...")
+    cooc_dict = generate_song_cooccurrences(interactions, measure=SIMILARITY_MEASURE, top_m=TOP_M)
     
     # Salvar dados
     print("Salvando dados...")